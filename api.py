@@ -1,14 +1,20 @@
 from __future__ import annotations
 
-from typing import Any, Dict, List, Optional
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, Optional
 import time
 
-from fastapi import FastAPI, Response, Request, Header
+from fastapi import FastAPI, Response, Header
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel, Field
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 
+from functions.config import EXPOSE_RUNTIME_HEADER
+from functions.recommendation_fetch import warm_up_vector_search
 from functions.service import recommend_courses_by_weakness
-from functions.models import WeaknessRecommendations, CourseScore, Weakness
-from functions.utils.json_naming_converter import convert_keys_snake_to_camel
+from functions.models import WeaknessRecommendations, CourseScore
+from functions.utils.course_info_client import close_course_info_client
 from functions.utils.token_log import get_token_entries, reset_token_log
 
 
@@ -29,19 +35,52 @@ class RecommendationResponse(BaseModel):
     log: Optional[List[Dict[str, Any]]] = None
 
 
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    # Initialize Vertex and resolve the endpoint before serving, off the request path.
+    try:
+        await warm_up_vector_search()
+    except Exception as exc:
+        print(f"[WARN] Vector search warm-up failed: {exc}")
+    yield
+    await close_course_info_client()
+
+
 app = FastAPI(
     title="Course Recommendation API",
     version="0.1.0",
+    lifespan=lifespan,
 )
 
 
-@app.middleware("http")
-async def add_runtime_header(request: Request, call_next):
-    start = time.perf_counter()
-    response = await call_next(request)
-    elapsed = time.perf_counter() - start
-    response.headers["X-Runtime-Seconds"] = f"{elapsed:.2f}"
-    return response
+class RuntimeHeaderMiddleware:
+    """
+    Adds X-Runtime-Seconds to /v1/* responses.
+    Plain ASGI rather than @app.middleware("http"), so responses are not re-wrapped
+    and probes like /health pass straight through.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not scope["path"].startswith("/v1/"):
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+
+        async def send_with_runtime(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                elapsed = time.perf_counter() - start
+                MutableHeaders(scope=message).append("X-Runtime-Seconds", f"{elapsed:.2f}")
+            await send(message)
+
+        await self.app(scope, receive, send_with_runtime)
+
+
+if EXPOSE_RUNTIME_HEADER:
+    app.add_middleware(RuntimeHeaderMiddleware)
 
 
 @app.get("/health")
@@ -57,56 +96,49 @@ def favicon() -> Response:
 @app.post(
     "/v1/course-recommendations",
     response_model=RecommendationResponse,
-    response_model_exclude_none=True,
+    response_class=ORJSONResponse,
 )
-def get_recommendations(
+async def get_recommendations(
     request: RecommendationRequest,
     include_log: bool = Header(True, convert_underscores=False),
-) -> RecommendationResponse:
+) -> ORJSONResponse:
     reset_token_log()
-    results = recommend_courses_by_weakness(
+    results = await recommend_courses_by_weakness(
         weaknesses=request.weaknesses,
         max_courses_overall=request.max_course,
         max_courses_per_weakness=request.max_course_pr_weakness,
     )
     serialized = _serialize_results(results)
-    converted = convert_keys_snake_to_camel(
-        serialized,
-        preserve_container_keys={"metadata"},
-    )
+    # The payload is server-built JSON, so hand it to orjson directly instead of
+    # re-validating it through RecommendationResponse and jsonable_encoder.
+    content: Dict[str, Any] = {"recommendations": serialized}
     if include_log:
-        return RecommendationResponse(recommendations=converted, log=get_token_entries())
-    
-    return RecommendationResponse(recommendations=converted)
+        content["log"] = get_token_entries()
+    return ORJSONResponse(content=content)
 
 
+# Serializers emit the camelCase wire keys directly; metadata is passed through untouched.
 def _serialize_results(results: List[WeaknessRecommendations]) -> List[Dict[str, Any]]:
+    # Weakness fields already match the wire format, so the dataclass is left for
+    # orjson to serialize natively; CourseScore is flattened and needs a dict.
     return [
         {
-            "weakness": _serialize_weakness(entry.weakness),
-            "recommended_courses": [_serialize_course_score(cs) for cs in entry.recommendations],
+            "weakness": entry.weakness,
+            "recommendedCourses": [_serialize_course_score(cs) for cs in entry.recommendations],
         }
         for entry in results
     ]
 
 
-def _serialize_weakness(weakness: Weakness) -> Dict[str, Any]:
-    return {
-        "id": weakness.id,
-        "text": weakness.text,
-        "description": weakness.description,
-    }
-
-
 def _serialize_course_score(score: CourseScore) -> Dict[str, Any]:
     course = score.course
     return {
-        "course_id": course.id,
-        "lesson_title": course.lesson_title,
+        "courseId": course.id,
+        "lessonTitle": course.lesson_title,
         "description": course.description,
         "link": course.link,
         "metadata": course.metadata or {},
-        "weakness_id": score.weakness_id,
+        "weaknessId": score.weakness_id,
         "score": score.score,
         "reason": score.reason,
     }
@@ -10,9 +10,22 @@ DEFAULT_LOCATION = os.getenv("VERTEX_LOCATION", "asia-southeast1")
 
 ENDPOINT_DISPLAY_NAME = os.getenv("COURSE_ENDPOINT_DISPLAY_NAME", "courses_endpoint")
 DEPLOYED_INDEX_ID = os.getenv("COURSE_DEPLOYED_INDEX_ID", "deployed_courses_endpoint")
+# Full endpoint resource name; when set, endpoint discovery via list() is skipped entirely.
+ENDPOINT_RESOURCE_NAME = os.getenv("COURSE_ENDPOINT_RESOURCE_NAME", "")
+ENDPOINT_NAME_CACHE_PATH = Path(
+    os.getenv("COURSE_ENDPOINT_NAME_CACHE_PATH", "/tmp/course_endpoint.name")
+)
 EMBEDDING_MODEL_NAME = os.getenv("EMBEDDING_MODEL_NAME", "gemini-embedding-001")
-EMBEDDING_DIMENSION = int(os.getenv("EMBEDDING_DIMENSION", "3072"))
+# Matryoshka-truncated size; must match the dimension the deployed course index was built with.
+EMBEDDING_DIMENSION = int(os.getenv("EMBEDDING_DIMENSION", "768"))
+EMBEDDING_CACHE_MAXSIZE = int(os.getenv("EMBEDDING_CACHE_MAXSIZE", "2048"))
+# Optional directory for query embeddings persisted across restarts (one .npy per text).
+_EMBEDDING_CACHE_DIR = os.getenv("EMBEDDING_CACHE_DIR", "")
+EMBEDDING_CACHE_DIR = Path(_EMBEDDING_CACHE_DIR) if _EMBEDDING_CACHE_DIR else None
+# Process-wide cap on embed_content batches in flight across all requests.
+EMBEDDING_MAX_CONCURRENT_BATCHES = int(os.getenv("EMBEDDING_MAX_CONCURRENT_BATCHES", "4"))
 GENERATION_MODEL = os.getenv("GENERATION_MODEL", "gemini-2.5-flash")
+RERANK_CACHE_MAXSIZE = int(os.getenv("RERANK_CACHE_MAXSIZE", "4096"))
 
 API_KEY = os.getenv("GOOGLE_API_KEY")
 if not API_KEY:
@@ -32,3 +45,9 @@ COURSE_INFO_API_BASE_URL = os.getenv(
     "https://test-result-data-api-810737581373.asia-southeast1.run.app",
 )
 COURSE_INFO_API_TIMEOUT_SECONDS = float(os.getenv("COURSE_INFO_API_TIMEOUT_SECONDS", "5"))
+COURSE_INFO_API_MAX_RETRIES = int(os.getenv("COURSE_INFO_API_MAX_RETRIES", "3"))
+COURSE_INFO_CACHE_MAXSIZE = int(os.getenv("COURSE_INFO_CACHE_MAXSIZE", "10000"))
+COURSE_INFO_CACHE_TTL_SECONDS = float(os.getenv("COURSE_INFO_CACHE_TTL_SECONDS", "600"))
+
+# Set to "0" to drop the X-Runtime-Seconds header from /v1/* responses.
+EXPOSE_RUNTIME_HEADER = os.getenv("EXPOSE_RUNTIME_HEADER", "1") == "1"
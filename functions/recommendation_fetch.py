@@ -1,54 +1,125 @@
 from __future__ import annotations
 
+import asyncio
+import hashlib
+import math
+import os
+import tempfile
 import threading
 import time
-from typing import Any, List
+import weakref
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
 
+from google.api_core import exceptions as google_exceptions
 from google.cloud import aiplatform
 from google.cloud.aiplatform import MatchingEngineIndexEndpoint
 from google.genai.types import EmbedContentConfig
+import numpy as np
 import vertexai
 
 from .config import (
     DEFAULT_LOCATION,
     DEFAULT_PROJECT_ID,
     DEPLOYED_INDEX_ID,
+    EMBEDDING_CACHE_DIR,
+    EMBEDDING_CACHE_MAXSIZE,
     EMBEDDING_DIMENSION,
+    EMBEDDING_MAX_CONCURRENT_BATCHES,
     EMBEDDING_MODEL_NAME,
     ENDPOINT_DISPLAY_NAME,
+    ENDPOINT_NAME_CACHE_PATH,
+    ENDPOINT_RESOURCE_NAME,
     genai_client,
 )
 from .models import Course, CourseScore, Weakness
-from .utils.course_info_client import get_course_info
+from .utils.course_info_client import get_course_infos
+from .utils.lru_cache import LRUCache
 from .utils.token_log import log_token_usage
 
-# Initialize Vertex AI once for the internal API module.
-vertexai.init(project=DEFAULT_PROJECT_ID, location=DEFAULT_LOCATION)
-aiplatform.init(project=DEFAULT_PROJECT_ID, location=DEFAULT_LOCATION)
+# Vertex AI is initialized on first endpoint use (startup warm-up), not at import.
+_INIT_DONE = False
 _ENDPOINT: MatchingEngineIndexEndpoint | None = None
 _ENDPOINT_LOCK = threading.Lock()
+# Query embeddings keyed by (text, dim); stored as tuples so cached vectors stay immutable.
+_EMBEDDING_CACHE: LRUCache[Tuple[str, int], Tuple[float, ...]] = LRUCache(EMBEDDING_CACHE_MAXSIZE)
+# Shared by every request on a loop so the cap applies process-wide; one per loop because a
+# contended asyncio.Semaphore cannot be reused from another loop (e.g. repeated asyncio.run).
+_EMBED_BATCH_LIMITERS: weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore] = (
+    weakref.WeakKeyDictionary()
+)
 
 
-def fetch_recommendations_for_weakness(
-    weakness: Weakness,
+async def search_course_neighbors(
+    weaknesses: List[Weakness],
     max_courses_per_weakness: int,
-) -> List[CourseScore]:
+) -> List[List[Any]]:
+    """
+    Retrieve candidate neighbors for all weaknesses with one embedding call and
+    one multi-query find_neighbors call; one neighbor list per weakness, in order.
+    """
+    if not weaknesses:
+        return []
+
+    # Weaknesses whose text only differs in case or surrounding whitespace share one
+    # embedding and one ANN query; each still gets its own course scores later.
+    slot_by_text: Dict[str, int] = {}
+    query_texts: List[str] = []
+    slots: List[int] = []
+    for weakness in weaknesses:
+        key = weakness.text.strip().lower()
+        if key not in slot_by_text:
+            slot_by_text[key] = len(query_texts)
+            query_texts.append(weakness.text)
+        slots.append(slot_by_text[key])
+
     start = time.time()
-    neighbors = _query_vertex_index(weakness.text, max_courses_per_weakness)
+    query_vectors = await _embed_texts(query_texts)
+    unique_groups = await _query_vertex_index(query_vectors, max_courses_per_weakness)
+    neighbor_groups = [unique_groups[slot] for slot in slots]
     elapsed = time.time() - start
     log_token_usage(
-        usage=f"vector_search: {weakness.id}",
+        usage=f"vector_search: {', '.join(weakness.id for weakness in weaknesses)}",
         input_tokens=None,
         output_tokens=None,
         runtime_seconds=elapsed,
     )
-    recs = [_build_course_score(weakness, neighbor) for neighbor in neighbors]
-    return _dedupe_by_course(recs)
+    return neighbor_groups
 
 
-def _build_course_score(weakness: Weakness, neighbor: Any) -> CourseScore:
-    course_id = str(neighbor.id)
-    metadata = get_course_info(course_id)
+async def build_recommendations_for_weakness(
+    weakness: Weakness,
+    neighbors: List[Any],
+) -> Dict[str, CourseScore]:
+    """Build deduplicated candidates for one weakness, keyed by course id in retrieval order."""
+    # Pull ids and distances into parallel arrays once so scoring and dedupe are vectorized.
+    ids = np.array([str(neighbor.id) for neighbor in neighbors], dtype=object)
+    distances = np.fromiter(
+        (getattr(neighbor, "distance", 0.0) or 0.0 for neighbor in neighbors),
+        dtype=np.float64,
+        count=len(neighbors),
+    )
+    scores = 1.0 / (1.0 + distances)
+    # First (closest) hit per course wins; sorting the first indices keeps retrieval order.
+    _, first_idx = np.unique(ids, return_index=True)
+    first_idx.sort()
+    unique_ids = ids[first_idx].tolist()
+    unique_scores = scores[first_idx].tolist()
+
+    # Prefetch metadata for every candidate at once instead of one lookup per neighbor.
+    metadata_by_id = await get_course_infos(unique_ids)
+    return {
+        course_id: _build_course_score(weakness, course_id, score, metadata_by_id.get(course_id, {}))
+        for course_id, score in zip(unique_ids, unique_scores)
+    }
+
+
+def _build_course_score(
+    weakness: Weakness,
+    course_id: str,
+    score: float,
+    metadata: Dict[str, Any],
+) -> CourseScore:
     course_meta = metadata.get("course") if isinstance(metadata, dict) else None
     source = course_meta if isinstance(course_meta, dict) else metadata
     lesson_title = source.get("lesson_title") or source.get("lessonTitle") or "Untitled course"
@@ -61,8 +132,6 @@ def _build_course_score(weakness: Weakness, neighbor: Any) -> CourseScore:
         link=link,
         metadata=metadata,
     )
-    distance = float(getattr(neighbor, "distance", 0.0) or 0.0)
-    score = 1 / (1 + distance)
     reason = f"Retrieved by semantic match to weakness '{weakness.text[:80]}...'."
     return CourseScore(
         course=course,
@@ -72,16 +141,20 @@ def _build_course_score(weakness: Weakness, neighbor: Any) -> CourseScore:
     )
 
 
-def _query_vertex_index(query_text: str, limit: int) -> List[Any]:
-    endpoint = _get_endpoint()
-    query_vector = _embed_texts([query_text])[0]
-    neighbors = endpoint.find_neighbors(
+async def _query_vertex_index(query_vectors: List[List[float]], limit: int) -> List[List[Any]]:
+    """Run all query vectors through one find_neighbors RPC; one neighbor list per query."""
+    # Endpoint discovery and find_neighbors are sync RPCs in the aiplatform SDK.
+    endpoint = await asyncio.to_thread(_get_endpoint)
+    neighbors = await asyncio.to_thread(
+        endpoint.find_neighbors,
         deployed_index_id=DEPLOYED_INDEX_ID,
-        queries=[query_vector],
+        queries=query_vectors,
         num_neighbors=limit,
         return_full_datapoint=False,
     )
-    return neighbors[0] if neighbors else []
+    if not neighbors:
+        return [[] for _ in query_vectors]
+    return [list(group) for group in neighbors]
 
 
 def _get_endpoint() -> MatchingEngineIndexEndpoint:
@@ -92,46 +165,178 @@ def _get_endpoint() -> MatchingEngineIndexEndpoint:
     with _ENDPOINT_LOCK:
         if _ENDPOINT is not None:
             return _ENDPOINT
-        endpoints = aiplatform.MatchingEngineIndexEndpoint.list()
-        endpoint_name = ""
-        for ep in endpoints:
-            if ep.display_name == ENDPOINT_DISPLAY_NAME:
-                endpoint_name = ep.resource_name
-                break
-
-        if not endpoint_name:
-            raise ValueError(
-                f"Matching Engine endpoint with display name '{ENDPOINT_DISPLAY_NAME}' not found."
-            )
-        _ENDPOINT = MatchingEngineIndexEndpoint(index_endpoint_name=endpoint_name)
+        _init_vertex()
+        known_name = ENDPOINT_RESOURCE_NAME or _read_cached_endpoint_name()
+        if known_name:
+            _ENDPOINT = _load_endpoint(known_name)
+        if _ENDPOINT is None:
+            endpoint_name = _discover_endpoint_name()
+            _ENDPOINT = MatchingEngineIndexEndpoint(index_endpoint_name=endpoint_name)
+            _write_cached_endpoint_name(endpoint_name)
         return _ENDPOINT
 
 
-def _embed_texts(texts: List[str], dim: int = EMBEDDING_DIMENSION) -> List[List[float]]:
-    """Embed texts in batches to respect 100-request limit."""
+async def warm_up_vector_search() -> None:
+    """Resolve the Matching Engine endpoint and exercise the embedding path ahead of the first request."""
+    await asyncio.to_thread(_get_endpoint)
+    await _embed_texts(["warmup"])
+
+
+def _init_vertex() -> None:
+    # Called under _ENDPOINT_LOCK; the Vertex SDK is only needed for the endpoint.
+    global _INIT_DONE
+    if _INIT_DONE:
+        return
+    vertexai.init(project=DEFAULT_PROJECT_ID, location=DEFAULT_LOCATION)
+    aiplatform.init(project=DEFAULT_PROJECT_ID, location=DEFAULT_LOCATION)
+    _INIT_DONE = True
+
+
+def _load_endpoint(endpoint_name: str) -> MatchingEngineIndexEndpoint | None:
+    """Load a known endpoint, ignoring names that are stale or point at another endpoint."""
+    try:
+        endpoint = MatchingEngineIndexEndpoint(index_endpoint_name=endpoint_name)
+    except (google_exceptions.NotFound, google_exceptions.PermissionDenied, ValueError) as exc:
+        print(f"[WARN] Known endpoint '{endpoint_name}' could not be loaded: {exc}")
+        return None
+    if endpoint.display_name != ENDPOINT_DISPLAY_NAME:
+        return None
+    return endpoint
+
+
+def _discover_endpoint_name() -> str:
+    endpoints = aiplatform.MatchingEngineIndexEndpoint.list()
+    for ep in endpoints:
+        if ep.display_name == ENDPOINT_DISPLAY_NAME:
+            return ep.resource_name
+    raise ValueError(
+        f"Matching Engine endpoint with display name '{ENDPOINT_DISPLAY_NAME}' not found."
+    )
+
+
+def _read_cached_endpoint_name() -> str:
+    try:
+        return ENDPOINT_NAME_CACHE_PATH.read_text(encoding="utf-8").strip()
+    except OSError:
+        return ""
+
+
+def _write_cached_endpoint_name(endpoint_name: str) -> None:
+    # Best effort: a read-only filesystem only costs the list() call on the next cold start.
+    try:
+        ENDPOINT_NAME_CACHE_PATH.write_text(endpoint_name, encoding="utf-8")
+    except OSError as exc:
+        print(f"[WARN] Could not cache endpoint name at {ENDPOINT_NAME_CACHE_PATH}: {exc}")
+
+
+async def _embed_texts(texts: List[str], dim: int = EMBEDDING_DIMENSION) -> List[List[float]]:
+    """Embed texts, serving repeats from the caches and sending only misses to Gemini."""
+    vectors: List[Tuple[float, ...] | None] = [_EMBEDDING_CACHE.get((text, dim)) for text in texts]
+    misses = list(dict.fromkeys(text for text, vec in zip(texts, vectors) if vec is None))
+    if misses:
+        fetched = await _embed_uncached(misses, dim)
+        for text, vec in fetched.items():
+            _EMBEDDING_CACHE.set((text, dim), vec)
+        vectors = [vec if vec is not None else fetched[text] for text, vec in zip(texts, vectors)]
+    return [list(vec) for vec in vectors]
+
+
+async def _embed_uncached(texts: List[str], dim: int) -> Dict[str, Tuple[float, ...]]:
+    """Resolve in-memory misses from the on-disk cache (if configured), then Gemini."""
+    if EMBEDDING_CACHE_DIR is None:
+        return dict(zip(texts, await _embed_with_gemini(texts, dim)))
+
+    found = await asyncio.to_thread(_read_disk_embeddings, texts, dim)
+    remaining = [text for text in texts if text not in found]
+    if remaining:
+        embedded = dict(zip(remaining, await _embed_with_gemini(remaining, dim)))
+        await asyncio.to_thread(_write_disk_embeddings, embedded, dim)
+        found.update(embedded)
+    return found
+
+
+async def _embed_with_gemini(texts: List[str], dim: int) -> List[Tuple[float, ...]]:
+    """Embed texts in batches to respect 100-request limit; batches run concurrently."""
     batch_size = 100
-    all_vectors: List[List[float]] = []
-    for start in range(0, len(texts), batch_size):
-        batch = texts[start:start + batch_size]
-        resp = genai_client.models.embed_content(
-            model=EMBEDDING_MODEL_NAME,
-            contents=batch,
-            config=EmbedContentConfig(
-                task_type="RETRIEVAL_DOCUMENT",
-                output_dimensionality=dim,
-            ),
-        )
-        all_vectors.extend([e.values for e in resp.embeddings])
-    return all_vectors
-
-
-def _dedupe_by_course(recs: List[CourseScore]) -> List[CourseScore]:
-    seen: set[str] = set()
-    unique: List[CourseScore] = []
-    for rec in recs:
-        cid = rec.course.id
-        if cid in seen:
+    limiter = _embed_batch_limiter()
+
+    async def embed_batch(batch: List[str]) -> List[Tuple[float, ...]]:
+        async with limiter:
+            resp = await genai_client.aio.models.embed_content(
+                model=EMBEDDING_MODEL_NAME,
+                contents=batch,
+                config=EmbedContentConfig(
+                    task_type="RETRIEVAL_DOCUMENT",
+                    output_dimensionality=dim,
+                ),
+            )
+        return [_l2_normalize(e.values) for e in resp.embeddings]
+
+    # gather keeps batch order, so vectors line up with `texts`.
+    batches = await asyncio.gather(
+        *(embed_batch(texts[start:start + batch_size]) for start in range(0, len(texts), batch_size))
+    )
+    return [vector for batch in batches for vector in batch]
+
+
+def _embed_batch_limiter() -> asyncio.Semaphore:
+    loop = asyncio.get_running_loop()
+    limiter = _EMBED_BATCH_LIMITERS.get(loop)
+    if limiter is None:
+        limiter = _EMBED_BATCH_LIMITERS[loop] = asyncio.Semaphore(EMBEDDING_MAX_CONCURRENT_BATCHES)
+    return limiter
+
+
+def _embedding_cache_path(text: str, dim: int) -> Path:
+    key = hashlib.blake2b(
+        f"{EMBEDDING_MODEL_NAME}|{dim}|{text}".encode("utf-8"),
+        digest_size=16,
+    ).hexdigest()
+    return EMBEDDING_CACHE_DIR / f"{key}.npy"
+
+
+def _read_disk_embeddings(texts: List[str], dim: int) -> Dict[str, Tuple[float, ...]]:
+    found: Dict[str, Tuple[float, ...]] = {}
+    for text in texts:
+        try:
+            found[text] = tuple(np.load(_embedding_cache_path(text, dim)).tolist())
+        except (OSError, ValueError):
             continue
-        seen.add(cid)
-        unique.append(rec)
-    return unique
+    return found
+
+
+def _write_disk_embeddings(vectors: Dict[str, Tuple[float, ...]], dim: int) -> None:
+    # Best effort: a failed write only means the next process embeds the text again.
+    try:
+        EMBEDDING_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    except OSError as exc:
+        print(f"[WARN] Could not create embedding cache dir {EMBEDDING_CACHE_DIR}: {exc}")
+        return
+    for text, vec in vectors.items():
+        path = _embedding_cache_path(text, dim)
+        tmp_path = None
+        try:
+            # Unique temp name per write, so concurrent misses on the same text cannot collide.
+            with tempfile.NamedTemporaryFile(
+                dir=EMBEDDING_CACHE_DIR, suffix=".tmp", delete=False
+            ) as fh:
+                tmp_path = fh.name
+                # float64 matches the in-memory tuples, so a restarted process serves the same vectors.
+                np.save(fh, np.asarray(vec, dtype=np.float64))
+            os.replace(tmp_path, path)
+        except OSError as exc:
+            print(f"[WARN] Could not write embedding cache file {path}: {exc}")
+            if tmp_path is not None:
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
+
+
+def _l2_normalize(values: List[float]) -> Tuple[float, ...]:
+    # gemini-embedding-001 only normalizes full 3072-dim output; truncated (MRL) vectors are not.
+    norm = math.sqrt(sum(v * v for v in values))
+    if not norm:
+        return tuple(values)
+    return tuple(v / norm for v in values)
+
@@ -1,57 +1,111 @@
 from __future__ import annotations
 
-import json
+import hashlib
+import textwrap
 import time
-from typing import List
+from typing import Any, Dict, List, Tuple
 
-from .config import GENERATION_MODEL, genai_client
+import orjson
+from google.genai.types import GenerateContentConfig
+
+from .config import GENERATION_MODEL, RERANK_CACHE_MAXSIZE, genai_client
 from .models import CourseScore, Weakness
+from .utils.lru_cache import LRUCache
 from .utils.token_log import extract_token_counts, log_token_usage
 
 llm_client = genai_client
+# Re-rank results keyed by (model, weakness text, candidate ids); stores (course_id, score, reason).
+_RERANK_CACHE: LRUCache[str, Tuple[Tuple[str, float, str], ...]] = LRUCache(RERANK_CACHE_MAXSIZE)
+# Structured output keeps the reply a bare JSON array of rerank items. The schema is a
+# plain dict because google-genai 0.5.0 mis-serializes Schema instances.
+_RERANK_CONFIG = GenerateContentConfig(
+    response_mime_type="application/json",
+    response_schema={
+        "type": "ARRAY",
+        "items": {
+            "type": "OBJECT",
+            "properties": {
+                "course_id": {"type": "STRING"},
+                "relevance_score": {"type": "NUMBER"},
+                "justification": {"type": "STRING"},
+            },
+            "required": ["course_id", "relevance_score", "justification"],
+        },
+    },
+)
+
+# Dedented once at import so the indentation is not sent (and billed) with every prompt.
+_RERANK_TEMPLATE = textwrap.dedent(
+    """\
+    You are scoring courses for a single weakness.
+
+    DOMAIN RULE:
+    - If the weakness clearly indicates a domain (e.g., music theory, English listening, SQL queries),
+      the courses MUST be highly correlated to that same domain to receive a high score.
+    - If a course is clearly out-of-domain, assign a very low score (0.0-0.2).
+    - If the weakness does NOT clearly indicate a domain, score based on general relevance only.
 
+    Weakness:
+    "{weakness_text}"
+
+    Candidate courses (keep all, just score relevance 0-1):
+    {rec_lines}
+
+    Output JSON ONLY:
+    [
+      {{"course_id": "<id>", "relevance_score": <0-1>, "justification": "<very short>"}},
+      ...
+    ]
+    """
+)
 
-def llm_rerank_for_weakness(
+
+async def llm_rerank_for_weakness(
     weakness: Weakness,
     recommendations: List[CourseScore],
     model: str = GENERATION_MODEL,
+    rec_lookup: Dict[str, CourseScore] | None = None,
 ) -> List[CourseScore]:
     """
     Uses LLM to validate and re-rank the vector-search recommendations for one weakness.
+    rec_lookup maps course id to recommendation; pass it when the caller already has one.
     """
     if not recommendations:
         return []
 
+    if rec_lookup is None:
+        rec_lookup = {r.course.id: r for r in recommendations}
+    cache_key = _rerank_cache_key(weakness.text, rec_lookup, model)
+    cached = _RERANK_CACHE.get(cache_key)
+    if cached is not None:
+        log_token_usage(
+            usage=f"agent4: rerank weakness {weakness.id} (cached)",
+            input_tokens=None,
+            output_tokens=None,
+            runtime_seconds=0.0,
+        )
+        return _apply_cached_scores(rec_lookup, cached)
+
     prompt = _build_rerank_prompt(weakness.text, recommendations)
     try:
         response = None
         start = time.time()
-        response = llm_client.models.generate_content(
+        response = await llm_client.aio.models.generate_content(
             model=model,
             contents=[{"parts": [{"text": prompt}]}],
+            config=_RERANK_CONFIG,
         )
-        raw = (response.text or "").strip()
-        raw = raw.replace("```json", "").replace("```", "").strip()
-        data = json.loads(raw)
-        if not isinstance(data, list):
+        # Structured output returns a bare JSON array, so no fence stripping is needed.
+        items = orjson.loads(response.text or "[]")
+        if not isinstance(items, list):
             return recommendations
-        rec_lookup = {r.course.id: r for r in recommendations}
         rescored: List[CourseScore] = []
-        for item in data:
-            cid = item.get("course_id")
-            if cid not in rec_lookup:
-                continue
-            base = rec_lookup[cid]
-            score = float(item.get("relevance_score", base.score))
-            justification = item.get("justification") or base.reason
-            rescored.append(
-                CourseScore(
-                    course=base.course,
-                    weakness_id=base.weakness_id,
-                    score=score,
-                    reason=justification,
-                )
-            )
+        for item in items:
+            rec = _rescore(item, rec_lookup)
+            if rec is not None:
+                rescored.append(rec)
+        if rescored:
+            _RERANK_CACHE.set(cache_key, tuple((r.course.id, r.score, r.reason) for r in rescored))
         return rescored or recommendations
     except Exception as exc:
         print(f"[WARN] LLM re-rank failed for weakness {weakness.id}: {exc}")
@@ -67,29 +121,47 @@ def llm_rerank_for_weakness(
         )
 
 
+def _rescore(item: Any, rec_lookup: Dict[str, CourseScore]) -> CourseScore | None:
+    # Malformed items are skipped so they do not discard the valid ones.
+    if not isinstance(item, dict):
+        return None
+    base = rec_lookup.get(item.get("course_id"))
+    if base is None:
+        return None
+    score = float(item.get("relevance_score", base.score))
+    justification = item.get("justification") or base.reason
+    return CourseScore(
+        course=base.course,
+        weakness_id=base.weakness_id,
+        score=score,
+        reason=justification,
+    )
+
+
+def _rerank_cache_key(weakness_text: str, rec_lookup: Dict[str, CourseScore], model: str) -> str:
+    course_ids = ",".join(sorted(rec_lookup))
+    payload = f"{model}|{weakness_text}|{course_ids}".encode("utf-8")
+    return hashlib.blake2b(payload, digest_size=16).hexdigest()
+
+
+def _apply_cached_scores(
+    rec_lookup: Dict[str, CourseScore],
+    cached: Tuple[Tuple[str, float, str], ...],
+) -> List[CourseScore]:
+    return [
+        CourseScore(
+            course=rec_lookup[cid].course,
+            weakness_id=rec_lookup[cid].weakness_id,
+            score=score,
+            reason=reason,
+        )
+        for cid, score, reason in cached
+    ]
+
+
 def _build_rerank_prompt(weakness_text: str, recommendations: List[CourseScore]) -> str:
     rec_lines = "\n".join(
         f'- id="{r.course.id}", title="{r.course.lesson_title}"'
         for r in recommendations
     )
-    return f"""
-        You are scoring courses for a single weakness.
-
-        DOMAIN RULE:
-        - If the weakness clearly indicates a domain (e.g., music theory, English listening, SQL queries),
-          the courses MUST be highly correlated to that same domain to receive a high score.
-        - If a course is clearly out-of-domain, assign a very low score (0.0-0.2).
-        - If the weakness does NOT clearly indicate a domain, score based on general relevance only.
-
-        Weakness:
-        "{weakness_text}"
-
-        Candidate courses (keep all, just score relevance 0-1):
-        {rec_lines}
-
-        Output JSON ONLY:
-        [
-          {{"course_id": "<id>", "relevance_score": <0-1>, "justification": "<very short>"}},
-          ...
-        ]
-        """
+    return _RERANK_TEMPLATE.format(weakness_text=weakness_text, rec_lines=rec_lines)
@@ -1,16 +1,19 @@
 from __future__ import annotations
 
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import asyncio
 import uuid
+from collections import defaultdict
 from typing import Any, Dict, Iterable, List
 
+import numpy as np
+
 from .config import GENERATION_MODEL
 from .models import CourseScore, Weakness, WeaknessRecommendations
-from .recommendation_fetch import fetch_recommendations_for_weakness
+from .recommendation_fetch import build_recommendations_for_weakness, search_course_neighbors
 from .rerank import llm_rerank_for_weakness
 
 
-def recommend_courses_by_weakness(
+async def recommend_courses_by_weakness(
     weaknesses: Iterable[Dict[str, Any]] | Iterable[Weakness],
     max_courses_overall: int,
     max_courses_per_weakness: int,
@@ -27,23 +30,22 @@ def recommend_courses_by_weakness(
         raise ValueError("max_courses_per_weakness must be >= 1.")
 
     parsed_weaknesses = _normalize_weaknesses(weaknesses)
-    recs_by_weakness = _recommend_by_weakness(
+    recs_per_weakness = await _recommend_by_weakness(
         parsed_weaknesses,
         max_courses_per_weakness,
     )
-    all_recs: List[CourseScore] = []
-    for weakness in parsed_weaknesses:
-        all_recs.extend(recs_by_weakness.get(weakness.id, []))
+    all_recs: List[CourseScore] = [rec for recs in recs_per_weakness for rec in recs]
 
-    deduped = _dedupe_by_best_score(all_recs)
-    deduped.sort(key=lambda r: r.score, reverse=True)
-    capped = deduped[:max_courses_overall]
+    capped = _top_unique_by_score(all_recs, max_courses_overall)
     return _rebuild_results(parsed_weaknesses, capped, max_courses_per_weakness)
 
 
 def _normalize_weaknesses(
     weaknesses: Iterable[Dict[str, Any]] | Iterable[Weakness],
 ) -> List[Weakness]:
+    # Internal callers usually pass Weakness objects already; hand the list back as-is.
+    if isinstance(weaknesses, list) and all(type(w) is Weakness for w in weaknesses):
+        return weaknesses
     parsed: List[Weakness] = []
     for item in weaknesses:
         if isinstance(item, Weakness):
@@ -64,40 +66,37 @@ def _normalize_weaknesses(
     return parsed
 
 
-def _recommend_by_weakness(
+async def _recommend_by_weakness(
     weaknesses: List[Weakness],
     max_courses_per_weakness: int,
-) -> Dict[str, List[CourseScore]]:
+) -> List[List[CourseScore]]:
+    """Return candidate recommendations per weakness, aligned with `weaknesses`."""
     if not weaknesses:
-        return {}
-
-    max_workers = min(8, len(weaknesses))
-    if max_workers <= 1:
-        return {
-            weakness.id: _recommend_for_weakness(weakness, max_courses_per_weakness)
-            for weakness in weaknesses
-        }
-
-    recs_by_weakness: Dict[str, List[CourseScore]] = {}
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        future_map = {
-            executor.submit(_recommend_for_weakness, weakness, max_courses_per_weakness): weakness.id
-            for weakness in weaknesses
-        }
-        for future in as_completed(future_map):
-            wid = future_map[future]
-            recs_by_weakness[wid] = future.result()
-    return recs_by_weakness
-
-
-def _recommend_for_weakness(
+        return []
+
+    neighbor_groups = await search_course_neighbors(weaknesses, max_courses_per_weakness)
+    # Each weakness runs metadata lookup and re-rank as one task, so a weakness whose
+    # metadata is ready starts its LLM call without waiting for the others.
+    return await asyncio.gather(
+        *(
+            _recommend_for_weakness(weakness, neighbors)
+            for weakness, neighbors in zip(weaknesses, neighbor_groups)
+        )
+    )
+
+
+async def _recommend_for_weakness(
     weakness: Weakness,
-    max_courses_per_weakness: int,
+    neighbors: List[Any],
 ) -> List[CourseScore]:
-    recs = fetch_recommendations_for_weakness(weakness, max_courses_per_weakness)
-    reranked = llm_rerank_for_weakness(weakness, recs, model=GENERATION_MODEL)
-    reranked.sort(key=lambda r: r.score, reverse=True)
-    return reranked
+    candidates = await build_recommendations_for_weakness(weakness, neighbors)
+    # Left unsorted: the entry point ranks all weaknesses' candidates in one pass.
+    return await llm_rerank_for_weakness(
+        weakness,
+        list(candidates.values()),
+        model=GENERATION_MODEL,
+        rec_lookup=candidates,
+    )
 
 
 def _rebuild_results(
@@ -105,9 +104,10 @@ def _rebuild_results(
     recommendations: List[CourseScore],
     max_courses_per_weakness: int,
 ) -> List[WeaknessRecommendations]:
-    recs_by_weakness: Dict[str, List[CourseScore]] = {}
+    # `recommendations` arrives score-sorted, so each group is already in order.
+    recs_by_weakness: Dict[str, List[CourseScore]] = defaultdict(list)
     for rec in recommendations:
-        recs_by_weakness.setdefault(rec.weakness_id, []).append(rec)
+        recs_by_weakness[rec.weakness_id].append(rec)
 
     results: List[WeaknessRecommendations] = []
     for weakness in weaknesses:
@@ -121,11 +121,15 @@ def _rebuild_results(
     return results
 
 
-def _dedupe_by_best_score(recs: List[CourseScore]) -> List[CourseScore]:
-    best_by_course: Dict[str, CourseScore] = {}
-    for rec in recs:
-        cid = rec.course.id
-        existing = best_by_course.get(cid)
-        if existing is None or rec.score > existing.score:
-            best_by_course[cid] = rec
-    return list(best_by_course.values())
+def _top_unique_by_score(recs: List[CourseScore], limit: int) -> List[CourseScore]:
+    """Best-scoring recommendation per course, highest score first, capped at `limit`."""
+    if not recs:
+        return []
+    count = len(recs)
+    ids = np.fromiter((r.course.id for r in recs), dtype=object, count=count)
+    scores = np.fromiter((r.score for r in recs), dtype=np.float64, count=count)
+    # Stable, so among equal scores the earlier candidate wins and keeps its place.
+    order = np.argsort(-scores, kind="stable")
+    _, first_idx = np.unique(ids[order], return_index=True)
+    first_idx.sort()
+    return [recs[i] for i in order[first_idx[:limit]]]
@@ -1,46 +1,133 @@
 from __future__ import annotations
 
-import json
-import threading
-import socket
-import urllib.error
-import urllib.request
-from typing import Any, Dict
+import asyncio
+from typing import Any, Dict, Iterable, Optional
 
-from ..config import COURSE_INFO_API_BASE_URL, COURSE_INFO_API_TIMEOUT_SECONDS
+import httpx
 
-_CACHE: Dict[str, Dict[str, Any]] = {}
-_LOCK = threading.Lock()
+from ..config import (
+    COURSE_INFO_API_BASE_URL,
+    COURSE_INFO_API_MAX_RETRIES,
+    COURSE_INFO_API_TIMEOUT_SECONDS,
+    COURSE_INFO_CACHE_MAXSIZE,
+    COURSE_INFO_CACHE_TTL_SECONDS,
+)
+from .lru_cache import LRUCache
 
+# Failed lookups are cached as {} too, so a flaky course id is retried only after the TTL.
+_CACHE: LRUCache[str, Dict[str, Any]] = LRUCache(
+    COURSE_INFO_CACHE_MAXSIZE,
+    ttl_seconds=COURSE_INFO_CACHE_TTL_SECONDS,
+)
+# One pooled client so lookups reuse keep-alive connections. It is tied to the loop it was
+# created on, so a new one is built when called from another loop (e.g. repeated asyncio.run).
+_CLIENT: Optional[httpx.AsyncClient] = None
+_CLIENT_LOOP: Optional[asyncio.AbstractEventLoop] = None
+_RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+_RETRY_BACKOFF_SECONDS = 0.2
+# Lookups currently on the wire, so concurrent callers asking for the same id
+# (e.g. one course retrieved for several weaknesses) share a single request.
+_IN_FLIGHT: Dict[str, asyncio.Task[Dict[str, Any]]] = {}
 
-def get_course_info(course_id: str) -> Dict[str, Any]:
-    if not course_id or not COURSE_INFO_API_BASE_URL:
-        return {}
 
-    with _LOCK:
+async def get_course_info(course_id: str) -> Dict[str, Any]:
+    """Return course metadata by id; the returned dict is shared and must not be mutated."""
+    infos = await get_course_infos([course_id])
+    return infos.get(course_id, {})
+
+
+async def get_course_infos(course_ids: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+    """
+    Return metadata for several course ids, keyed by id.
+    Cached ids are served without I/O; the rest are fetched concurrently, at most
+    once per id across all concurrent callers.
+    """
+    infos: Dict[str, Dict[str, Any]] = {}
+    missing: list[str] = []
+    for course_id in dict.fromkeys(course_ids):
+        if not course_id:
+            continue
         cached = _CACHE.get(course_id)
-    if cached is not None:
-        return cached
+        if cached is not None:
+            infos[course_id] = cached
+        else:
+            missing.append(course_id)
+
+    if not missing or not COURSE_INFO_API_BASE_URL:
+        return infos
+
+    tasks = [_get_or_start_fetch(course_id) for course_id in missing]
+    # Shield the shared tasks so one cancelled caller does not cancel the others.
+    fetched = await asyncio.gather(*(asyncio.shield(task) for task in tasks))
+    infos.update(zip(missing, fetched))
+    return infos
+
+
+def _get_or_start_fetch(course_id: str) -> asyncio.Task[Dict[str, Any]]:
+    loop = asyncio.get_running_loop()
+    task = _IN_FLIGHT.get(course_id)
+    if task is not None and task.get_loop() is loop:
+        return task
+
+    task = loop.create_task(_get_uncached_course_info(_get_client(), course_id))
+    _IN_FLIGHT[course_id] = task
+
+    def _forget(done: asyncio.Task[Dict[str, Any]]) -> None:
+        if _IN_FLIGHT.get(course_id) is done:
+            del _IN_FLIGHT[course_id]
+
+    task.add_done_callback(_forget)
+    return task
+
+
+async def close_course_info_client() -> None:
+    """Close the shared HTTP client; the next lookup opens a new one."""
+    global _CLIENT, _CLIENT_LOOP
+    client, client_loop = _CLIENT, _CLIENT_LOOP
+    _CLIENT, _CLIENT_LOOP = None, None
+    # A client left over from another loop cannot be closed from this one; just drop it.
+    if client is not None and client_loop is asyncio.get_running_loop():
+        await client.aclose()
+
+
+def _get_client() -> httpx.AsyncClient:
+    global _CLIENT, _CLIENT_LOOP
+    loop = asyncio.get_running_loop()
+    if _CLIENT is None or _CLIENT.is_closed or _CLIENT_LOOP is not loop:
+        _CLIENT_LOOP = loop
+        _CLIENT = httpx.AsyncClient(
+            base_url=COURSE_INFO_API_BASE_URL,
+            timeout=COURSE_INFO_API_TIMEOUT_SECONDS,
+            # urllib followed redirects; keep that rather than caching a 3xx as a failed lookup.
+            follow_redirects=True,
+            # The transport retries failed connects; status retries are in _fetch_course_info.
+            transport=httpx.AsyncHTTPTransport(
+                retries=COURSE_INFO_API_MAX_RETRIES,
+                limits=httpx.Limits(max_connections=100, max_keepalive_connections=50),
+            ),
+        )
+    return _CLIENT
+
 
+async def _get_uncached_course_info(client: httpx.AsyncClient, course_id: str) -> Dict[str, Any]:
     data: Dict[str, Any] = {}
     try:
-        data = _fetch_course_info(course_id)
-    except (urllib.error.URLError, urllib.error.HTTPError, ValueError, TimeoutError, socket.timeout) as exc:
+        data = await _fetch_course_info(client, course_id)
+    except (httpx.HTTPError, ValueError) as exc:
         print(f"[WARN] Course info fetch failed for {course_id}: {exc}")
         data = {}
 
-    with _LOCK:
-        _CACHE[course_id] = data
+    _CACHE.set(course_id, data)
     return data
 
 
-def _fetch_course_info(course_id: str) -> Dict[str, Any]:
-    base = COURSE_INFO_API_BASE_URL.rstrip("/")
-    url = f"{base}/v1/course-info/{course_id}"
-    with urllib.request.urlopen(url, timeout=COURSE_INFO_API_TIMEOUT_SECONDS) as resp:
-        if getattr(resp, "status", None) not in (None, 200):
-            return {}
-        raw = resp.read()
-    if not raw:
+async def _fetch_course_info(client: httpx.AsyncClient, course_id: str) -> Dict[str, Any]:
+    for attempt in range(COURSE_INFO_API_MAX_RETRIES + 1):
+        resp = await client.get(f"/v1/course-info/{course_id}")
+        if resp.status_code not in _RETRY_STATUSES or attempt == COURSE_INFO_API_MAX_RETRIES:
+            break
+        await asyncio.sleep(_RETRY_BACKOFF_SECONDS * 2 ** attempt)
+    resp.raise_for_status()
+    if resp.status_code != 200 or not resp.content:
         return {}
-    return json.loads(raw.decode("utf-8"))
+    return resp.json()
@@ -0,0 +1,52 @@
+from __future__ import annotations
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Generic, Hashable, Optional, TypeVar
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+class LRUCache(Generic[K, V]):
+    """
+    Size-bounded, thread-safe LRU cache with optional per-entry expiry.
+    Cached values are shared between callers and must be treated as read-only.
+    """
+
+    def __init__(self, maxsize: int, ttl_seconds: Optional[float] = None) -> None:
+        if maxsize < 1:
+            raise ValueError("maxsize must be >= 1.")
+        self.maxsize = maxsize
+        self.ttl_seconds = ttl_seconds
+        self._data: OrderedDict[K, tuple[float, V]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: K) -> Optional[V]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if time.monotonic() >= expires_at:
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: K, value: V) -> None:
+        expires_at = time.monotonic() + self.ttl_seconds if self.ttl_seconds else float("inf")
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._data)
@@ -1,17 +1,19 @@
 """
 Lightweight run-scoped logging helpers for token usage.
 Agents append token stats here; pipeline reads once per run and writes to run_log.json.
+The log lives in a ContextVar so concurrent requests on one event loop stay separate.
 """
 from __future__ import annotations
 
+from contextvars import ContextVar
 from typing import Any, Dict, List
 
-_token_entries: List[Dict[str, Any]] = []
+_token_entries: ContextVar[List[Dict[str, Any]]] = ContextVar("token_entries", default=[])
 
 
 def reset_token_log() -> None:
-    """Clear token log for a new pipeline run."""
-    _token_entries.clear()
+    """Start a fresh token log for a new pipeline run in the current context."""
+    _token_entries.set([])
 
 
 def log_token_usage(
@@ -26,7 +28,7 @@ def log_token_usage(
         "output_token": output_tokens if output_tokens is not None else 0,
         "runtime": round(runtime_seconds or 0.0, 4),
     }
-    _token_entries.append(entry)
+    _token_entries.get().append(entry)
 
 
 def extract_token_counts(response: Any) -> tuple[int | None, int | None]:
@@ -53,7 +55,7 @@ def extract_token_counts(response: Any) -> tuple[int | None, int | None]:
 
 def get_token_entries() -> List[Dict[str, Any]]:
     """Return a shallow copy of the token log entries for the current run."""
-    return list(_token_entries)
+    return list(_token_entries.get())
 
 
 def _get_value(usage_meta: Any, possible_keys: list[str]) -> int | None: